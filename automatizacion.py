@@ -1,14 +1,45 @@
 import sys
 import csv
+import codecs
+import itertools
+import random
 import pandas as pd
 import pyodbc
-from os.path import isfile
+from datetime import date
+from os.path import isfile, getsize
 from tkinter import Tk
 from tkinter.filedialog import askopenfilename
 
 YEAR_MIN = 1900
 YEAR_MAX = 2100
+ENTERO_MAX = 2**63 - 1
 FIELD_COUNT = 19
+TIPOS_CAMPOS = {
+    1: "fecha",
+    2: "entero",
+    3: "mes",
+    5: "entero",
+    7: "entero",
+    9: "entero",
+    11: "entero",
+    14: "flotante",
+    15: "flotante",
+    16: "entero",
+    19: "si_no",
+}
+VERIFICACION_PREVIA = True
+MUESTRA_FILAS = 100
+MUESTRA_ALEATORIAS = 100
+MUESTRA_BLOQUE = 1024 * 1024
+MUESTRA_LINEAS_REGISTRO = 20
+MUESTRA_VENTANA = 64 * 1024
+CODIFICACION = None
+CARGA_PARCIAL = False
+ARCHIVO_CUARENTENA = "cuarentena.csv"
+MAX_RECHAZOS = 0.01
+SALIDA = "odbc"
+ARCHIVO_SALIDA = "registros"
+TAM_BLOQUE = 100000
 
 
 def solicitar_archivo():
@@ -32,10 +63,299 @@ def solicitar_archivo():
     return archivo
 
 
-def leer_archivo(archivo: str):
+def leer_primeros(archivo: str, n_filas: int, codificacion: str):
+    """Lee con el módulo csv el encabezado y los primeros `n_filas`
+    registros del archivo CSV en la ruta `archivo`. Devuelve el
+    encabezado como texto y una lista de tuplas con la línea donde
+    empieza cada registro y el registro. Termina la ejecución si un
+    registro ocupa más de `MUESTRA_LINEAS_REGISTRO` líneas, señal de
+    una comilla sin cerrar.
+    """
+    muestras = []
+
+    with open(archivo, mode="r", newline="", encoding=codificacion) as ar:
+        encabezado = ar.readline()
+
+        # Limita las líneas leídas para que una comilla sin cerrar no
+        # obligue a leer el archivo completo
+        limite = n_filas * MUESTRA_LINEAS_REGISTRO
+        lector = csv.reader(itertools.islice(ar, limite), delimiter=",", quotechar='"')
+
+        # El encabezado es la línea 1 y `line_num` no lo cuenta
+        inicio = 2
+        for registro in lector:
+            fin = lector.line_num + 1
+            if fin - inicio + 1 > MUESTRA_LINEAS_REGISTRO:
+                print(
+                    "Error: Verificación previa: el registro en la línea "
+                    + str(inicio)
+                    + " tiene una comilla sin cerrar"
+                )
+                sys.exit(25)
+
+            # Si se acabaron las líneas permitidas el último registro
+            # puede estar incompleto
+            if lector.line_num >= limite:
+                break
+
+            muestras.append((inicio, registro))
+            inicio = fin + 1
+
+            if len(muestras) >= n_filas:
+                break
+
+    return encabezado, muestras
+
+
+def verificar_muestra(
+    archivo: str,
+    n_campos: int,
+    n_filas: int = MUESTRA_FILAS,
+    n_aleatorias: int = MUESTRA_ALEATORIAS,
+    codificacion: str | None = CODIFICACION,
+    parcial: bool = False,
+):
+    """Revisa una muestra del archivo CSV en la ruta `archivo` antes
+    de leerlo completo: los primeros y últimos `n_filas` registros y
+    `n_aleatorias` líneas tomadas desde posiciones al azar. Termina la
+    ejecución si detecta un delimitador, número de campos,
+    codificación, comilla o tipo incorrecto. El encabezado solo se usa
+    para sugerir el delimitador. Con `parcial`, los registros con un
+    número de campos o tipo incorrecto no terminan la ejecución,
+    porque la carga parcial los envía a cuarentena, y solo se informa
+    cuántos hay en la muestra.
+    """
+
+    # Solo los CSV se pueden muestrear sin leerlos completos
+    if not archivo.endswith(".csv") or not isfile(archivo):
+        return
+
+    detectada = codificacion is None
+    if detectada:
+        codificacion = detectar_codificacion(archivo)
+
+    # Primeros registros, leídos en orden desde el inicio
+    try:
+        encabezado, primeros = leer_primeros(archivo, n_filas, codificacion)
+    except UnicodeDecodeError:
+        # La detección solo revisa el primer bloque, si no es UTF-8 se
+        # lee como Latin-1, que acepta cualquier byte
+        if not detectada:
+            print(
+                "Error: Verificación previa: el archivo no se puede leer con"
+                + " la codificación '"
+                + codificacion
+                + "'"
+            )
+            sys.exit(18)
+
+        codificacion = "latin-1"
+        encabezado, primeros = leer_primeros(archivo, n_filas, codificacion)
+
+    muestras = [
+        ("la línea " + str(linea), registro, True) for linea, registro in primeros
+    ]
+
+    # Las posiciones al azar solo sirven si la codificación separa las
+    # líneas con el mismo byte que ASCII
+    try:
+        compatible = b'\n,"'.decode(codificacion) == '\n,"'
+    except UnicodeDecodeError:
+        compatible = False
+
+    lineas = []
+    tamano = getsize(archivo)
+
+    with open(archivo, mode="rb") as ar:
+        ar.readline()
+        inicio = ar.tell()
+
+        # Sin comillas en el primer bloque no se esperan campos con
+        # saltos de línea
+        comillas = b'"' in ar.read(MUESTRA_BLOQUE)
+
+        # Últimas líneas, descartando la primera línea del bloque por
+        # estar probablemente incompleta. Si el bloque tiene comillas no
+        # se sabe si cada línea empieza un registro o está dentro de un
+        # campo con saltos de línea
+        if compatible and inicio < tamano:
+            desde = max(inicio, tamano - MUESTRA_BLOQUE)
+            ar.seek(desde)
+            bloque = ar.read()
+            if desde > inicio:
+                corte = bloque.find(b"\n") + 1
+                desde += corte
+                bloque = bloque[corte:]
+
+            filas = []
+            for linea in bloque.split(b"\n"):
+                filas.append((desde, linea))
+                desde += len(linea) + 1
+            if filas and filas[-1][1] == b"":
+                filas.pop()
+
+            confirmado = not comillas and b'"' not in bloque
+            for posicion, linea in filas[-n_filas:]:
+                lineas.append((posicion, linea, confirmado))
+
+        # Líneas desde posiciones al azar en el resto del archivo
+        if compatible and inicio < tamano:
+            posiciones = random.sample(
+                range(inicio, tamano), min(n_aleatorias, tamano - inicio)
+            )
+            for desde in sorted(posiciones):
+                # Sin comillas en la ventana anterior la línea no puede
+                # estar dentro de un campo con saltos de línea
+                ventana = max(inicio, desde - MUESTRA_VENTANA)
+                ar.seek(ventana)
+                anterior = ar.read(desde - ventana) + ar.readline()
+                posicion = ar.tell()
+                linea = ar.readline()
+                if linea:
+                    confirmado = not comillas and b'"' not in anterior + linea
+                    lineas.append((posicion, linea, confirmado))
+
+    # Valida la codificación de las líneas y las lee como registros
+    for posicion, linea, confirmado in lineas:
+        try:
+            texto = linea.decode(codificacion)
+        except UnicodeDecodeError:
+            if detectada:
+                codificacion = "latin-1"
+                texto = linea.decode(codificacion)
+            else:
+                print(
+                    "Error: Verificación previa: el texto en el byte "
+                    + str(posicion)
+                    + " no se puede leer con la codificación '"
+                    + codificacion
+                    + "'"
+                )
+                sys.exit(18)
+
+        # Una línea con comillas que no se sabe si empieza un registro
+        # solo se revisa si se puede leer como un registro completo
+        if texto.count('"') % 2 == 1:
+            continue
+
+        registro = next(csv.reader([texto], delimiter=",", quotechar='"'), [])
+        muestras.append(("el byte " + str(posicion), registro, confirmado))
+
+    # Valida el número de campos y el tipo de cada registro de la muestra
+    rechazados = 0
+    for etiqueta, registro, confirmado in muestras:
+        if len(registro) != n_campos:
+            if not confirmado:
+                continue
+
+            # Usa el encabezado para sugerir el delimitador correcto
+            try:
+                texto = encabezado.lstrip("\ufeff")
+                delimitador = csv.Sniffer().sniff(texto, delimiters=",;\t|").delimiter
+            except csv.Error:
+                delimitador = ","
+
+            if delimitador != ",":
+                print(
+                    "Error: Verificación previa: el registro en "
+                    + etiqueta
+                    + " no tiene "
+                    + str(n_campos)
+                    + " campos separados por ',', el delimitador parece ser '"
+                    + delimitador
+                    + "'"
+                )
+                sys.exit(19)
+
+            if parcial:
+                rechazados += 1
+                continue
+
+            print(
+                "Error: Verificación previa: el registro en "
+                + etiqueta
+                + " tiene "
+                + str(len(registro))
+                + " campos y se esperaban "
+                + str(n_campos)
+            )
+            sys.exit(20)
+
+        for campo, tipo in TIPOS_CAMPOS.items():
+            codigo, motivo = motivo_invalido(registro[campo - 1], tipo, campo)
+            if codigo and parcial:
+                rechazados += 1
+                break
+
+            if codigo:
+                print("Error: Verificación previa: en " + etiqueta + ", " + motivo)
+                sys.exit(21)
+
+    if rechazados > 0:
+        print(
+            "Aviso: Verificación previa: "
+            + str(rechazados)
+            + " registros de la muestra irán a cuarentena"
+        )
+
+
+def detectar_codificacion(archivo: str):
+    """Detecta la codificación del archivo en la ruta `archivo` a
+    partir de su primer bloque: 'utf-8-sig' si tiene BOM, 'utf-8' si
+    el bloque es UTF-8 válido y 'latin-1' en otro caso. Como solo se
+    revisa el primer bloque, quien lee el archivo debe volver a
+    'latin-1' si encuentra bytes que no son UTF-8 más adelante.
+    """
+
+    with open(archivo, mode="rb") as ar:
+        bloque = ar.read(MUESTRA_BLOQUE)
+
+    if bloque.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+
+    # El bloque puede cortar un caracter multibyte al final, por eso
+    # se decodifica de forma incremental sin finalizar
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(bloque, final=False)
+    except UnicodeDecodeError:
+        return "latin-1"
+
+    return "utf-8"
+
+
+def leer_csv(archivo: str, codificacion: str):
+    """Abre el archivo CSV en la ruta `archivo` con la codificación
+    `codificacion` y lo convierte a una lista de listas de strings
+    donde cada fila es un registro, sin el encabezado. Devuelve
+    también la lista con la línea del archivo donde empieza cada
+    registro.
+    """
+    registros = []
+    lineas = []
+
+    with open(archivo, mode="r", newline="", encoding=codificacion) as ar:
+        archivoCSV = csv.reader(ar, delimiter=",", quotechar='"')
+
+        # Omite el encabezado
+        next(archivoCSV, None)
+        anterior = archivoCSV.line_num
+
+        # `line_num` es la última línea leída, que no es la primera
+        # del registro si tiene campos con saltos de línea
+        for registro in archivoCSV:
+            registros.append(registro)
+            lineas.append(anterior + 1)
+            anterior = archivoCSV.line_num
+
+    return registros, lineas
+
+
+def leer_archivo(archivo: str, codificacion: str | None = CODIFICACION):
     """Abre el archivo CSV en la ruta `archivo`, lee y lo convierte
     a una lista de listas de strings donde cada fila es un registro
-    y cada columna un campo
+    y cada columna un campo. Devuelve también la lista con la línea
+    del archivo donde empieza cada registro. Si no se indica
+    `codificacion` se detecta a partir del archivo.
     """
 
     # Comprueba que el archivo exista
@@ -44,16 +364,34 @@ def leer_archivo(archivo: str):
         sys.exit(1)
 
     if archivo.endswith(".csv"):
-        # Si es csv abre el archivo y retorna la lista
-        with open(archivo, mode="r", newline="") as ar:
-            archivoCSV = csv.reader(ar, delimiter=",", quotechar='"')
-            return [registro for registro in archivoCSV][1:]
+        # Si es csv abre el archivo con su codificación y retorna la lista
+        if codificacion is not None:
+            try:
+                return leer_csv(archivo, codificacion)
+            except UnicodeDecodeError:
+                print(
+                    "Error: El archivo no se puede leer con la codificación '"
+                    + codificacion
+                    + "'"
+                )
+                sys.exit(18)
+
+        codificacion = detectar_codificacion(archivo)
+        try:
+            return leer_csv(archivo, codificacion)
+        except UnicodeDecodeError:
+            # Hay bytes que no son UTF-8 después del primer bloque,
+            # se vuelve a leer como Latin-1, que acepta cualquier byte
+            print("Aviso: El archivo no es UTF-8, se lee como 'latin-1'")
+            return leer_csv(archivo, "latin-1")
 
     if archivo.endswith(".xlsx"):
-        # Si es xlsx abre el archivo y retorna la lista
+        # Si es xlsx abre el archivo y retorna la lista, cada registro
+        # ocupa una fila después del encabezado
         df = pd.read_excel(archivo)
         df = df.fillna("")
-        return df.astype(str).values.tolist()
+        registros = df.astype(str).values.tolist()
+        return registros, [i + 2 for i in range(len(registros))]
 
     # Si no es un archivo csv o xlsx
     print("Error: El archivo no es CSV ni XLSX.")
@@ -94,93 +432,161 @@ def validar_fecha(registros: list[list[str]], campo: int):
     `registros` cumple el formato de fecha 'aaaammdd'.
     """
     for i, registro in enumerate(registros):
-        valor = registro[campo - 1]
+        codigo, motivo = motivo_invalido(registro[campo - 1], "fecha", campo)
+
+        if codigo:
+            print("Error: En el registro " + str(i + 2) + ", " + motivo)
+            sys.exit(codigo)
+
+        # Una vez validado convierte a entero
+        registro[campo - 1] = convertir_valor(registro[campo - 1], "fecha")
+
+
+def validar_mes(registros: list[list[str]], campo: int):
+    """Comprueba si el valor en el `campo` en cada registro en
+    `registros` es un mes válido.
+    """
+    for i, registro in enumerate(registros):
+        codigo, motivo = motivo_invalido(registro[campo - 1], "mes", campo)
+
+        if codigo:
+            print("Error: En el registro " + str(i + 2) + ", " + motivo)
+            sys.exit(codigo)
+
+        registro[campo - 1] = convertir_valor(registro[campo - 1], "mes")
+
+
+def validar_entero(registros: list[list[str]], campo: int):
+    """Comprueba si el valor en el `campo` en cada registro en
+    `registros` es un número entero.
+    """
+    for i, registro in enumerate(registros):
+        codigo, motivo = motivo_invalido(registro[campo - 1], "entero", campo)
+
+        if codigo:
+            # Levanta un error indicando en qué registro sucede y
+            # el contenido del campo que levantó el error
+            print("Error: En el registro " + str(i + 2) + ", " + motivo)
+            sys.exit(codigo)
+
+        registro[campo - 1] = convertir_valor(registro[campo - 1], "entero")
+
+
+def validar_flotante(registros: list[list[str]], campo: int):
+    """Comprueba si el valor en el `campo` en cada registro en
+    `registros` es un número decimal.
+    """
+    for i, registro in enumerate(registros):
+        codigo, motivo = motivo_invalido(registro[campo - 1], "flotante", campo)
+
+        if codigo:
+            # Levanta un error indicando en qué registro sucede y
+            # el contenido del campo que levantó el error
+            print("Error: En el registro " + str(i + 2) + ", " + motivo)
+            sys.exit(codigo)
+
+        registro[campo - 1] = convertir_valor(registro[campo - 1], "flotante")
+
+
+def validar_si_no(registros: list[list[str]], campo: int):
+    """Comprueba si el valor en el `campo` en cada registro en
+    `registros` es un 'SI' o 'NO' sin distinguir mayúsculas y
+    minúsculas.
+    """
+    for i, registro in enumerate(registros):
+        codigo, motivo = motivo_invalido(registro[campo - 1], "si_no", campo)
+
+        if codigo:
+            # Levanta un error indicando el registro actual y el
+            # contenido del campo que levantó el error
+            print("Error: En el registro " + str(i + 2) + ", " + motivo)
+            sys.exit(codigo)
+
+        registro[campo - 1] = convertir_valor(registro[campo - 1], "si_no")
 
+
+def motivo_invalido(valor: str, tipo: str, campo: int):
+    """Comprueba si `valor` es válido para el `tipo` del `campo`
+    ('fecha', 'mes', 'entero', 'flotante' o 'si_no'). Devuelve una
+    tupla con el código de salida y el motivo por el que no es
+    válido, o `(0, "")` si lo es. Es la regla que usan los
+    validadores, la verificación previa y la cuarentena.
+    """
+
+    if tipo == "fecha":
         # Valida la longitud del campo
         if len(valor) != 8:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", la fecha del campo "
+            return (
+                5,
+                "la fecha del campo "
                 + str(campo)
                 + " no cumple con el formato 'aaaammdd' -> '"
                 + valor
-                + "'"
+                + "'",
             )
-            sys.exit(5)
 
         # Valida el valor del año
         try:
             year = int(valor[0:4])
         except:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el año de la fecha del campo "
+            return (
+                6,
+                "el año de la fecha del campo "
                 + str(campo)
                 + " no es un número entero -> '"
                 + valor
-                + "'"
+                + "'",
             )
-            sys.exit(6)
 
         # Valida el rango del año
         if year < YEAR_MIN or year > YEAR_MAX:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el año de la fecha del campo "
+            return (
+                7,
+                "el año de la fecha del campo "
                 + str(campo)
                 + " no está en el rango permitido ["
                 + str(YEAR_MIN)
                 + ", "
                 + str(YEAR_MAX)
                 + "] -> "
-                + valor
+                + valor,
             )
-            sys.exit(7)
 
         # Valida el valor del mes
         try:
             mes = int(valor[4:6])
         except:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el mes de la fecha del campo "
+            return (
+                8,
+                "el mes de la fecha del campo "
                 + str(campo)
                 + " no es un número entero -> '"
                 + valor
-                + "'"
+                + "'",
             )
-            sys.exit(8)
 
         # Valida el rango del mes
         if mes < 1 or mes > 12:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el mes de la fecha del campo "
+            return (
+                9,
+                "el mes de la fecha del campo "
                 + str(campo)
                 + " no está en el rango permitido -> "
-                + valor
+                + valor,
             )
-            sys.exit(9)
 
         # Valida el valor del día
         try:
             dia = int(valor[6:8])
         except:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el día de la fecha del campo "
+            return (
+                10,
+                "el día de la fecha del campo "
                 + str(campo)
                 + " no es un número entero -> '"
                 + valor
-                + "'"
+                + "'",
             )
-            sys.exit(10)
 
         diasMes = [
             31,
@@ -198,142 +604,216 @@ def validar_fecha(registros: list[list[str]], campo: int):
         ]
         # Valida el rango del día
         if dia < 1 or dia > diasMes[mes - 1]:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el día de la fecha del campo "
+            return (
+                11,
+                "el día de la fecha del campo "
                 + str(campo)
                 + " no está en el rango permitido -> "
-                + valor
+                + valor,
             )
-            sys.exit(11)
 
-        # Una vez validado convierte a entero
-        registro[campo - 1] = int(registro[campo - 1])
+        # Valida que la fecha completa se pueda convertir a entero
+        try:
+            int(valor)
+        except:
+            return (
+                5,
+                "la fecha del campo "
+                + str(campo)
+                + " no cumple con el formato 'aaaammdd' -> '"
+                + valor
+                + "'",
+            )
 
+        return (0, "")
 
-def validar_mes(registros: list[list[str]], campo: int):
-    """Comprueba si el valor en el `campo` en cada registro en
-    `registros` es un mes válido.
-    """
-    for i, registro in enumerate(registros):
+    if tipo == "mes":
         # Valida el valor del mes
         try:
-            registro[campo - 1] = int(registro[campo - 1])
+            mes = int(valor)
         except:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el valor del campo "
+            return (
+                12,
+                "el valor del campo "
                 + str(campo)
                 + " no es un número entero -> '"
-                + registro[campo - 1]
-                + "'"
+                + valor
+                + "'",
             )
-            sys.exit(12)
 
         # Valida el rango del mes
-        if registro[campo - 1] < 1 or registro[campo - 1] > 12:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el valor del campo "
-                + str(campo)
-                + " no es un mes válido -> "
-                + registro[campo - 1]
+        if mes < 1 or mes > 12:
+            return (
+                13,
+                "el valor del campo " + str(campo) + " no es un mes válido -> " + valor,
             )
-            sys.exit(13)
 
+        return (0, "")
 
-def validar_entero(registros: list[list[str]], campo: int):
-    """Comprueba si el valor en el `campo` en cada registro en
-    `registros` es un número entero.
-    """
-    for i, registro in enumerate(registros):
-        # Intenta convertir el valor del campo del registro
-        # actual en entero
+    if tipo == "entero":
+        # Intenta convertir el valor en entero
         try:
-            registro[campo - 1] = int(registro[campo - 1])
+            entero = int(valor)
         except:
-            # En caso de no poder convertir, levanta un error
-            # indicando en qué registro sucede y el contenido
-            # del campo que levantó el error
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el valor del campo "
+            return (
+                14,
+                "el valor del campo "
                 + str(campo)
                 + " no es un número entero -> '"
-                + registro[campo - 1]
-                + "'"
+                + valor
+                + "'",
             )
-            sys.exit(14)
 
         # Comprueba que sea positivo
-        if registro[campo - 1] < 0:
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el valor del campo "
+        if entero < 0:
+            return (
+                15,
+                "el valor del campo "
                 + str(campo)
                 + " no es un número entero positivo -> "
-                + registro[campo - 1]
+                + valor,
             )
-            sys.exit(15)
 
+        # Comprueba que quepa en un entero de 64 bits
+        if entero > ENTERO_MAX:
+            return (
+                26,
+                "el valor del campo "
+                + str(campo)
+                + " supera el máximo de un entero de 64 bits -> "
+                + valor,
+            )
 
-def validar_flotante(registros: list[list[str]], campo: int):
-    """Comprueba si el valor en el `campo` en cada registro en
-    `registros` es un número decimal.
-    """
-    for i, registro in enumerate(registros):
-        registro[campo - 1] = registro[campo - 1].replace(",", "")
+        return (0, "")
+
+    if tipo == "flotante":
+        valor = valor.replace(",", "")
 
-        # Intenta convertir el valor del campo del registro
-        # actual en flotante
+        # Intenta convertir el valor en flotante
         try:
-            registro[campo - 1] = float(registro[campo - 1])
+            float(valor)
         except:
-            # En caso de no poder convertir, levanta un error
-            # indicando en qué registro sucede y el contenido
-            # del campo que levantó el error
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el valor del campo "
+            return (
+                16,
+                "el valor del campo "
                 + str(campo)
                 + " no es un número flotante -> '"
-                + registro[campo - 1]
-                + "'"
+                + valor
+                + "'",
             )
-            sys.exit(16)
 
+        return (0, "")
 
-def validar_si_no(registros: list[list[str]], campo: int):
-    """Comprueba si el valor en el `campo` en cada registro en
-    `registros` es un 'SI' o 'NO' sin distinguir mayúsculas y
-    minúsculas.
-    """
-    permitidos = ["SI", "NO"]
+    if tipo == "si_no":
+        valor = valor.upper()
 
-    for i, registro in enumerate(registros):
-        registro[campo - 1] = registro[campo - 1].upper()
-
-        if not registro[campo - 1] in permitidos:
-            # En caso de que el valor del campo del registro
-            # actual no sea ni 'SI' ni 'NO', levanta un error
-            # indicando el registro actual y el contenido del
-            # campo que levantó el error
-            print(
-                "Error: En el registro "
-                + str(i + 2)
-                + ", el valor del campo "
+        if not valor in ["SI", "NO"]:
+            return (
+                17,
+                "el valor del campo "
                 + str(campo)
                 + " no pertenece al conjunto {'SI', 'NO'} -> '"
-                + registro[campo - 1]
-                + "'"
+                + valor
+                + "'",
             )
-            sys.exit(17)
+
+        return (0, "")
+
+    return (0, "")
+
+
+def convertir_valor(valor: str, tipo: str):
+    """Convierte `valor`, ya validado con `motivo_invalido`, al tipo
+    que se carga para el `tipo` de campo.
+    """
+
+    if tipo == "flotante":
+        return float(valor.replace(",", ""))
+
+    if tipo == "si_no":
+        return valor.upper()
+
+    # 'fecha', 'mes' y 'entero' se cargan como enteros
+    return int(valor)
+
+
+def motivo_registro(registro: list[str], n_campos: int):
+    """Comprueba si `registro` tiene `n_campos` campos y si cada campo
+    de `TIPOS_CAMPOS` es válido. Devuelve el motivo por el que no es
+    válido o un string vacío si lo es.
+    """
+
+    if len(registro) > n_campos:
+        return "tiene uno o más campos extras -> " + ",".join(registro[n_campos:])
+
+    if len(registro) < n_campos:
+        return "tiene menos campos del esperado"
+
+    for campo, tipo in TIPOS_CAMPOS.items():
+        codigo, motivo = motivo_invalido(registro[campo - 1], tipo, campo)
+        if codigo:
+            return motivo
+
+    return ""
+
+
+def separar_rechazados(
+    registros: list[list[str]],
+    lineas: list[int],
+    n_campos: int,
+    archivo_cuarentena: str = ARCHIVO_CUARENTENA,
+    max_rechazos: float = MAX_RECHAZOS,
+):
+    """Escribe en el CSV `archivo_cuarentena` cada registro inválido
+    de `registros`, con la línea del archivo donde empieza según
+    `lineas` y el motivo, y devuelve la lista de registros válidos
+    con sus campos ya convertidos, sin necesidad de pasar por los
+    validadores. Termina la ejecución si los rechazados superan la
+    fracción `max_rechazos` del total.
+    """
+    limite = max_rechazos * len(registros)
+    validos = []
+    rechazados = 0
+
+    with open(archivo_cuarentena, mode="w", newline="", encoding="utf-8") as ar:
+        cuarentena = csv.writer(ar, delimiter=",", quotechar='"')
+        encabezado = ["campo " + str(i + 1) for i in range(n_campos)]
+        cuarentena.writerow(["linea", "motivo"] + encabezado)
+
+        for i, registro in enumerate(registros):
+            motivo = motivo_registro(registro, n_campos)
+
+            if not motivo:
+                for campo, tipo in TIPOS_CAMPOS.items():
+                    registro[campo - 1] = convertir_valor(registro[campo - 1], tipo)
+                validos.append(registro)
+                continue
+
+            cuarentena.writerow([lineas[i], motivo] + registro)
+            rechazados += 1
+
+            # Aborta en cuanto los rechazados superan el límite, sin
+            # revisar el resto de los registros
+            if rechazados > limite:
+                print(
+                    "Error: Los registros rechazados superan el "
+                    + str(max_rechazos * 100)
+                    + "% del total, revise '"
+                    + archivo_cuarentena
+                    + "'"
+                )
+                sys.exit(22)
+
+    if rechazados > 0:
+        print(
+            "Se rechazaron "
+            + str(rechazados)
+            + " registros, revise '"
+            + archivo_cuarentena
+            + "'"
+        )
+
+    return validos
 
 
 def biciesto(year):
@@ -366,30 +846,132 @@ def migrar(cursor, registros):
     cursor.commit()
 
 
+def verificar_salida(salida: str):
+    """Comprueba que `salida` sea 'odbc', 'parquet' o 'arrow' y que
+    pyarrow esté instalado si se exporta a Parquet o Arrow, para
+    terminar la ejecución antes de leer el archivo.
+    """
+
+    if not salida in ["odbc", "parquet", "arrow"]:
+        print("Error: La salida '" + salida + "' no es válida.")
+        sys.exit(24)
+
+    if salida != "odbc":
+        try:
+            import pyarrow
+        except ImportError:
+            print("Error: Se requiere pyarrow para exportar a Parquet o Arrow.")
+            sys.exit(23)
+
+
+def exportar_columnar(
+    registros: list[list],
+    n_campos: int,
+    archivo_salida: str = ARCHIVO_SALIDA,
+    formato: str = SALIDA,
+    tam_bloque: int = TAM_BLOQUE,
+):
+    """Escribe los `registros` ya validados en el archivo
+    `archivo_salida` con `formato` 'parquet' o 'arrow' (Arrow IPC)
+    como extensión, en bloques de `tam_bloque` registros. El tipo de
+    cada columna se toma de `TIPOS_CAMPOS`, las fechas 'aaaammdd' se
+    escriben como fechas y los campos sin validar quedan como texto.
+    Devuelve la ruta del archivo escrito.
+    """
+
+    if not formato in ["parquet", "arrow"]:
+        print("Error: El formato de exportación '" + formato + "' no es válido.")
+        sys.exit(24)
+
+    verificar_salida(formato)
+    archivo_salida += "." + formato
+
+    # pyarrow solo se necesita para esta salida
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos = {
+        "fecha": pa.date32(),
+        "mes": pa.int64(),
+        "entero": pa.int64(),
+        "flotante": pa.float64(),
+        "si_no": pa.string(),
+        "texto": pa.string(),
+    }
+    esquema = pa.schema(
+        [
+            ("campo_" + str(campo), tipos[TIPOS_CAMPOS.get(campo, "texto")])
+            for campo in range(1, n_campos + 1)
+        ]
+    )
+
+    if formato == "parquet":
+        escritor = pq.ParquetWriter(archivo_salida, esquema)
+    else:
+        escritor = pa.ipc.new_file(archivo_salida, esquema)
+
+    with escritor:
+        for inicio in range(0, len(registros), tam_bloque):
+            # Convierte el bloque de filas en columnas
+            columnas = list(zip(*registros[inicio : inicio + tam_bloque]))
+
+            # Las fechas validadas son enteros 'aaaammdd'
+            for campo, tipo in TIPOS_CAMPOS.items():
+                if tipo == "fecha" and campo <= len(columnas):
+                    columnas[campo - 1] = [
+                        date(valor // 10000, valor // 100 % 100, valor % 100)
+                        for valor in columnas[campo - 1]
+                    ]
+
+            bloque = pa.record_batch(
+                [
+                    pa.array(columna, type=campo.type)
+                    for columna, campo in zip(columnas, esquema)
+                ],
+                schema=esquema,
+            )
+            escritor.write_batch(bloque)
+
+    return archivo_salida
+
+
+VALIDADORES = {
+    "fecha": validar_fecha,
+    "mes": validar_mes,
+    "entero": validar_entero,
+    "flotante": validar_flotante,
+    "si_no": validar_si_no,
+}
+
+
+verificar_salida(SALIDA)
+
 archivo = solicitar_archivo()
 print(archivo)
 
+if VERIFICACION_PREVIA:
+    print("Verificando muestra...")
+    verificar_muestra(archivo, FIELD_COUNT, parcial=CARGA_PARCIAL)
+
 print("Leyendo...")
-registros = leer_archivo(archivo)
+registros, lineas = leer_archivo(archivo)
 
 print("Validando...")
-validar_numero_campos(registros, FIELD_COUNT)
-validar_fecha(registros, 1)
-validar_entero(registros, 2)
-validar_mes(registros, 3)
-validar_entero(registros, 5)
-validar_entero(registros, 7)
-validar_entero(registros, 9)
-validar_entero(registros, 11)
-validar_flotante(registros, 14)
-validar_flotante(registros, 15)
-validar_entero(registros, 16)
-validar_si_no(registros, 19)
-
-print("Cargando...")
-cursor = conectar_pyodbc(
-    "{DRIVER}", "SERVER", "BASE_DATOS", "USUARIO", "CONTRASEÑA"
-)
-migrar(cursor, registros)
-
-print("Carga finalizada.")
+if CARGA_PARCIAL:
+    registros = separar_rechazados(registros, lineas, FIELD_COUNT)
+else:
+    validar_numero_campos(registros, FIELD_COUNT)
+    for campo, tipo in TIPOS_CAMPOS.items():
+        VALIDADORES[tipo](registros, campo)
+
+if SALIDA == "odbc":
+    print("Cargando...")
+    cursor = conectar_pyodbc(
+        "{DRIVER}", "SERVER", "BASE_DATOS", "USUARIO", "CONTRASEÑA"
+    )
+    migrar(cursor, registros)
+    print("Carga finalizada.")
+else:
+    print("Exportando...")
+    archivo_salida = exportar_columnar(registros, FIELD_COUNT)
+    print("Exportación finalizada: '" + archivo_salida + "'")